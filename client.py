@@ -1,175 +1,545 @@
-from __future__ import division
-import collections
+import asyncio
 import contextlib
-import functools
+import importlib.util
+import logging
+import multiprocessing
+import os
+import queue
+import re
 import signal
+import threading
+import time
+import wave
+from multiprocessing import shared_memory
+
+# Use protobuf's C++ implementation when it's installed: serializing a request
+# per audio payload is much cheaper than with the pure-Python one. protobuf 3.20
+# (the v1beta1 generated code predates 4.x) only ships C++ wheels up to Python
+# 3.10, so on newer interpreters this is a no-op. This has to happen before
+# anything imports a protobuf message.
+if importlib.util.find_spec('google.protobuf.pyext._message') is not None:
+	os.environ.setdefault('PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION', 'cpp')
+
 import google.auth
 import google.auth.transport.grpc
 import google.auth.transport.requests
 from google.cloud.grpc.speech.v1beta1 import cloud_speech_pb2
 from google.rpc import code_pb2
 import grpc
+import numpy
 import pyaudio
-from six.moves import queue
-from playsound import playsound
+
+# The capture process is spawned rather than forked: by the time it starts, this
+# process has already initialised PortAudio and gRPC, neither of which is fork-safe.
+mp_context = multiprocessing.get_context('spawn')
+
+logger = logging.getLogger(__name__)
+
+
+class AudioBuffer:
+	"""A fixed-size ring of audio chunks in shared memory.
+	
+	Chunks are written by the capture process, from its PortAudio callback, and
+	read by a single consumer on the main process's event loop, so capturing
+	audio never contends for the GIL with sending it. The producer only copies
+	into the next free slot, advances `head` and writes a byte to the notify
+	pipe, which the event loop watches; the consumer is the only one to advance
+	`tail`. If the reader falls `slots` chunks behind, new chunks are dropped
+	and counted in `dropped`. Must be created on the event loop that reads from it.
+	"""
+	
+	def __init__(self, chunk_bytes, slots):
+		self.chunk_bytes = chunk_bytes
+		self.slots = slots
+		self.memory = shared_memory.SharedMemory(create=True, size=slots * chunk_bytes)
+		self.lengths = mp_context.RawArray('i', slots)
+		self.head = mp_context.RawValue('Q', 0)  # total number of chunks written
+		self.tail = mp_context.RawValue('Q', 0)  # total number of chunks read
+		self.dropped = mp_context.RawValue('Q', 0)  # total number of chunks dropped
+		self.notify_reader, self.notify_writer = mp_context.Pipe(duplex=False)
+		os.set_blocking(self.notify_reader.fileno(), False)
+		os.set_blocking(self.notify_writer.fileno(), False)
+		
+		# Consumer-side state, which stays in the main process.
+		self.stopping = False
+		self.reported_dropped = 0
+		self.wakeup = asyncio.Event()
+		self.loop = asyncio.get_running_loop()
+		self.loop.add_reader(self.notify_reader.fileno(), self._on_notify)
+	
+	
+	def __getstate__(self):
+		# Only the shared state is sent to the capture process.
+		state = self.__dict__.copy()
+		for name in ('notify_reader', 'stopping', 'reported_dropped', 'wakeup', 'loop'):
+			del state[name]
+		return state
+	
+	
+	def write(self, data):
+		"""Copies a chunk of at most `chunk_bytes` into the next slot, dropping it
+		if the ring is full.
+		"""
+		head = self.head.value
+		if head - self.tail.value >= self.slots:
+			self.dropped.value += 1
+			return
+		
+		slot = head % self.slots
+		start = slot * self.chunk_bytes
+		self.memory.buf[start:start + len(data)] = data
+		self.lengths[slot] = len(data)
+		self.head.value = head + 1
+		
+		try:
+			os.write(self.notify_writer.fileno(), b'\0')
+		except BlockingIOError:
+			# The pipe is full of unread notifications, so the reader will wake up anyway.
+			pass
+	
+	
+	def _on_notify(self):
+		os.read(self.notify_reader.fileno(), 4096)
+		self.wakeup.set()
+	
+	
+	async def _wait(self, timeout=None):
+		"""Waits up to `timeout` seconds for a chunk to be written or stop() to be called."""
+		self.wakeup.clear()
+		try:
+			await asyncio.wait_for(self.wakeup.wait(), timeout)
+		except asyncio.TimeoutError:
+			pass
+	
+	
+	def pending_bytes(self):
+		"""Returns the number of bytes written but not yet read."""
+		return sum(self.lengths[i % self.slots] for i in range(self.tail.value, self.head.value))
+	
+	
+	async def read(self, min_bytes=0, max_wait_secs=0, max_bytes=None):
+		"""Returns unread audio as a single bytes object.
+		Waits until at least one chunk is available, then keeps waiting up to
+		`max_wait_secs` for `min_bytes` of audio to build up, so small chunks go
+		out together. At most `max_bytes`, rounded up to whole chunks, is
+		returned; the rest is left for the next read. Returns None, leaving any
+		unread audio in place for the next reader, if stop() has been called.
+		"""
+		while self.tail.value == self.head.value and not self.stopping:
+			await self._wait()
+		
+		deadline = time.monotonic() + max_wait_secs
+		while self.pending_bytes() < min_bytes and not self.stopping:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				break
+			await self._wait(remaining)
+		
+		if self.stopping:
+			self.stopping = False
+			return None
+		
+		# Snapshot `head` once and drain up to it (or the cap) in one pass, only
+		# publishing the new `tail` to the producer at the end. Joining views of
+		# the slots copies each one exactly once.
+		tail = self.tail.value
+		head = self.head.value
+		if max_bytes is not None:
+			head = min(head, tail + -(-max_bytes // self.chunk_bytes))
+		data = b''.join([self._slot_view(i % self.slots) for i in range(tail, head)])
+		self.tail.value = head
+		
+		dropped = self.dropped.value
+		if dropped != self.reported_dropped:
+			logger.warning('Dropped %d chunks of audio while the reader was stalled',
+				dropped - self.reported_dropped)
+			self.reported_dropped = dropped
+		
+		return data
+	
+	
+	def _slot_view(self, slot):
+		start = slot * self.chunk_bytes
+		return self.memory.buf[start:start + self.lengths[slot]]
+	
+	
+	def stop(self):
+		"""Signals the current reader to stop."""
+		self.stopping = True
+		self.wakeup.set()
+	
+	
+	def close(self):
+		"""Releases the shared memory and notify pipe. Only called by the process
+		that created the buffer.
+		"""
+		self.loop.remove_reader(self.notify_reader.fileno())
+		self.notify_reader.close()
+		self.notify_writer.close()
+		self.memory.close()
+		self.memory.unlink()
+
+
+class SilenceGate:
+	"""Decides which chunks of 16-bit audio are worth sending.
+	
+	A chunk is silent if its RMS level is below `threshold`. Audio keeps going
+	through for `hangover` silent chunks after the last non-silent one, so the
+	API still hears the end of an utterance, and after that only one chunk in
+	every `keepalive` is let through to keep the stream from timing out.
+	"""
+	
+	def __init__(self, chunk_samples, threshold, hangover, keepalive):
+		self.squares = numpy.empty(chunk_samples, dtype=numpy.int32)
+		self.threshold_squared = threshold ** 2
+		self.hangover = hangover
+		self.keepalive = keepalive
+		self.silent_chunks = 0
+	
+	
+	def is_open(self, data):
+		"""Returns whether the given chunk should be sent."""
+		samples = numpy.frombuffer(data, dtype=numpy.int16)
+		squares = self.squares[:len(samples)]
+		numpy.multiply(samples, samples, out=squares, dtype=numpy.int32)
+		
+		# Compare the mean square against the squared threshold to skip the sqrt.
+		if squares.mean() < self.threshold_squared:
+			self.silent_chunks += 1
+		else:
+			self.silent_chunks = 0
+		
+		return self.silent_chunks <= self.hangover or self.silent_chunks % self.keepalive == 0
+
+
+class OverlapBuffer:
+	"""A fixed-size rolling window over the most recently sent audio.
+	
+	The window is replayed at the start of the next stream, so that speech
+	straddling a reconnect isn't lost.
+	"""
+	
+	def __init__(self, size):
+		self.ring = bytearray(size)
+		self.offset = 0  # where the next byte is written
+		self.length = 0  # how many bytes of the ring hold audio
+	
+	
+	def __len__(self):
+		return self.length
+	
+	
+	def extend(self, data):
+		"""Appends audio, overwriting the oldest audio once the window is full."""
+		size = len(self.ring)
+		data = memoryview(data)[-size:]
+		n = len(data)
+		
+		first = min(n, size - self.offset)
+		self.ring[self.offset:self.offset + first] = data[:first]
+		self.ring[:n - first] = data[first:]
+		
+		self.offset = (self.offset + n) % size
+		self.length = min(self.length + n, size)
+	
+	
+	def tobytes(self):
+		"""Returns the buffered audio, oldest first."""
+		if self.length < len(self.ring):
+			return bytes(self.ring[:self.length])
+		return bytes(self.ring[self.offset:] + self.ring[:self.offset])
+	
+	
+	def clear(self):
+		self.offset = 0
+		self.length = 0
 
 
 class Client:
 	RATE = 16000
-	CHUNK = int(RATE / 10)  # 100ms
+	CHUNK = RATE // 10  # 100ms
 	SECS_OVERLAP = 1
 	CHANNELS = 1
 	FORMAT = pyaudio.paInt16
+	SAMPLE_WIDTH = pyaudio.get_sample_size(FORMAT)
+	OVERLAP_BYTES = SECS_OVERLAP * RATE * CHANNELS * SAMPLE_WIDTH
+	# Chunks quieter than SILENCE_RMS aren't sent once there's been a second of
+	# silence, apart from one every 5 seconds to keep the stream alive.
+	SILENCE_RMS = 200
+	SILENCE_HANGOVER_CHUNKS = 10
+	SILENCE_KEEPALIVE_CHUNKS = 50
+	# How long sending audio can stall before captured audio starts being dropped.
+	MAX_STALL_SECS = 10
 	# The Speech API has a streaming limit of 60 seconds of audio*, so keep the
 	# connection alive for that long, plus some more to give the API time to figure
 	# out the transcription.
 	# * https://g.co/cloud/speech/limits#content
 	DEADLINE_SECS = 60 * 3 + 5
+	# Audio chunks are coalesced into fewer, larger requests: a batch is sent
+	# once it has been collecting for BATCH_SECS or holds MAX_BATCH_BYTES of audio.
+	BATCH_SECS = 0.25
+	MAX_BATCH_BYTES = 8 * 1024
+	SPEECH_HOST = 'speech.googleapis.com'
+	SPEECH_PORT = 443
 	SPEECH_SCOPE = 'https://www.googleapis.com/auth/cloud-platform'
+	# 16kHz mono audio is only 32KB/s, so there's no need for large HTTP/2
+	# buffers or for BDP probing to grow the flow-control window. Keepalive
+	# pings detect a dead connection during a stream; a new stream is opened as
+	# soon as the last one ends, so none are needed without an active call.
+	CHANNEL_OPTIONS = [
+		('grpc.http2.write_buffer_size', 0),
+		('grpc.http2.lookahead_bytes', 64 * 1024),
+		('grpc.http2.bdp_probe', 0),
+		('grpc.http2.min_time_between_pings_ms', 10000),
+		('grpc.keepalive_time_ms', 30000),
+	]
 	BOT_NAME = 'Jarvis'
-	ATTENTION_SOUND_PATH = 'attention.wav'
+	ATTENTION_RE = re.compile(r'\b' + re.escape(BOT_NAME) + r'\b', re.IGNORECASE)
+	ATTENTION_INITIALS = (BOT_NAME[0].lower(), BOT_NAME[0].upper())
+	ATTENTION_SOUND_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attention.wav')
+	
+	# Initial config requests, keyed by (rate, interim_results).
+	_config_requests = {}
 	
 	
 	def __init__(self):
 		self.audio_interface = pyaudio.PyAudio()
 		self.listening_for_prompt = True
 		self.listening_for_command = False
+		self._last_transcript = ''
+		self.recognize_stream = None
+		self._interrupted = False
+		
+		# Credentials are only loaded once, and shared by every channel.
+		self.channel_credentials = self.make_credentials()
+		
+		# Preload the attention sound and keep an output stream open for it, so
+		# playing it is just a write from a background thread.
+		sound = wave.open(self.ATTENTION_SOUND_PATH, 'rb')
+		try:
+			self.attention_frames = sound.readframes(sound.getnframes())
+			self.attention_stream = self.audio_interface.open(
+				format=self.audio_interface.get_format_from_width(sound.getsampwidth()),
+				channels=sound.getnchannels(), rate=sound.getframerate(),
+				output=True)
+		finally:
+			sound.close()
+		
+		self.attention_requests = queue.Queue()
+		self.attention_thread = threading.Thread(target=self._attention_player)
+		self.attention_thread.daemon = True
+		self.attention_thread.start()
 	
 	
-	def listen(self):
-		service = cloud_speech_pb2.SpeechStub(self.make_channel('speech.googleapis.com', 443))
+	async def listen(self):
+		loop = asyncio.get_running_loop()
 		
-		# For streaming audio from the microphone, there are three threads.
-		# First, a thread that collects audio data as it comes in
-		with self.record_audio(self.RATE, self.CHUNK) as buff:
-			# Second, a thread that sends requests with that data
-			overlap_buffer = collections.deque(maxlen=self.SECS_OVERLAP * self.RATE / self.CHUNK)
-			requests = self.request_stream(self._audio_data_generator(buff, overlap_buffer), self.RATE)
-			# Third, a thread that listens for transcription responses
-			recognize_stream = service.StreamingRecognize(
-				requests, self.DEADLINE_SECS)
-			
-			# Exit things cleanly on interrupt
-			signal.signal(signal.SIGINT, lambda *_: recognize_stream.cancel())
-			
-			# Now, put the transcription responses to use.
-			try:
-				while True:
-					self.listen_print_loop(recognize_stream, buff)
-					
-					# Discard this stream and create a new one.
-					# Note: calling .cancel() doesn't immediately raise an RpcError
-					# - it only raises when the iterator's next() is requested
-					recognize_stream.cancel()
-					
-					requests = self.request_stream(self._audio_data_generator(
-						buff, overlap_buffer), self.RATE)
-					# Third, a thread that listens for transcription responses
-					recognize_stream = service.StreamingRecognize(
-						requests, self.DEADLINE_SECS)
-			
-			except grpc.RpcError:
-				# This happens because of the interrupt handler
-				pass
+		# For streaming audio from the microphone, a separate process collects
+		# audio data as it comes in, while the event loop both sends requests
+		# with that data and listens for transcription responses. The capture
+		# process is started before the channel is opened.
+		async with self.record_audio(self.RATE, self.CHUNK) as buff:
+			# A single channel (and HTTP/2 connection) is shared by every stream, so
+			# reconnecting doesn't have to redo the TLS handshake.
+			async with self.make_channel(self.SPEECH_HOST, self.SPEECH_PORT) as channel:
+				service = cloud_speech_pb2.SpeechStub(channel)
+				overlap_buffer = OverlapBuffer(self.OVERLAP_BYTES)
+				
+				# Exit things cleanly on interrupt. The handler is installed once and
+				# always cancels whichever stream is current.
+				loop.add_signal_handler(signal.SIGINT, self._interrupt)
+				
+				# Now, put the transcription responses to use.
+				try:
+					while True:
+						requests = self.request_stream(self._audio_data_generator(
+							buff, overlap_buffer), self.RATE)
+						self.recognize_stream = service.StreamingRecognize(
+							requests, self.DEADLINE_SECS)
+						
+						await self.listen_print_loop(self.recognize_stream, buff)
+						
+						# Discard this stream and create a new one.
+						self.recognize_stream.cancel()
+				
+				except asyncio.CancelledError:
+					# An interrupt ends listening; any other cancellation is the listen()
+					# task's own. The call itself reports cancelled() either way, since
+					# grpc.aio cancels it when the task reading from it is cancelled.
+					if not self._interrupted:
+						raise
+				
+				finally:
+					loop.remove_signal_handler(signal.SIGINT)
 	
 	
-	def make_channel(self, host, port):
-		"""Creates a secure channel with auth credentials from the environment."""
+	def close(self):
+		"""Stops the attention player and releases the audio interface."""
+		self.attention_requests.put(None)
+		self.attention_thread.join()
+		
+		self.attention_stream.close()
+		self.audio_interface.terminate()
+	
+	
+	def _interrupt(self):
+		"""Cancels the current recognize stream, ending listen()."""
+		self._interrupted = True
+		self.recognize_stream.cancel()
+	
+	
+	def make_credentials(self):
+		"""Creates channel credentials with auth credentials from the environment."""
 		# Grab application default credentials from the environment
 		credentials, _ = google.auth.default(scopes=[self.SPEECH_SCOPE])
 		
-		# Create a secure channel using the credentials.
+		# Attach the credentials to every call as auth metadata.
 		http_request = google.auth.transport.requests.Request()
+		metadata_plugin = google.auth.transport.grpc.AuthMetadataPlugin(
+			credentials, http_request)
+		call_credentials = grpc.metadata_call_credentials(metadata_plugin)
+		
+		return grpc.composite_channel_credentials(
+			grpc.ssl_channel_credentials(), call_credentials)
+	
+	
+	def make_channel(self, host, port):
+		"""Creates a secure asyncio channel using the client's credentials."""
 		target = '{}:{}'.format(host, port)
 		
-		return google.auth.transport.grpc.secure_authorized_channel(
-			credentials, http_request, target)
+		return grpc.aio.secure_channel(
+			target, self.channel_credentials, options=self.CHANNEL_OPTIONS)
 
 
-	@staticmethod
-	def _audio_data_generator(buff, overlap_buffer):
-		"""A generator that yields all available data in the given buffer.
+	def _attention_player(self):
+		"""Plays the attention sound each time it's requested, until close()."""
+		while self.attention_requests.get() is not None:
+			self.attention_stream.write(self.attention_frames)
+	
+	
+	def _play_attention(self):
+		"""Plays the attention sound without blocking the caller."""
+		self.attention_requests.put(True)
+	
+	
+	@classmethod
+	async def _audio_data_generator(cls, buff, overlap_buffer):
+		"""An async generator that yields all available data in the given buffer.
 		Args:
-				buff - a Queue object, where each element is a chunk of data.
+				buff - an AudioBuffer filled by the recording stream.
 		Yields:
 				A chunk of data that is the aggregate of all chunks of data in `buff`.
-				The function will block until at least one data chunk is available.
+				The function will wait until at least one data chunk is available,
+				and for up to BATCH_SECS after that while less than MAX_BATCH_BYTES
+				is available. Each chunk is at most MAX_BATCH_BYTES, rounded up to
+				whole recorded chunks.
+		
+		The generator is only advanced once gRPC has finished writing the previous
+		request, so if the stream stalls, audio piles up in `buff` and goes out as
+		several back-to-back requests once it resumes. `buff` holds up to
+		MAX_STALL_SECS of audio; anything captured beyond that is dropped, and
+		logged on the next read.
 		"""
 		if overlap_buffer:
-			yield b''.join(overlap_buffer)
+			yield overlap_buffer.tobytes()
 			overlap_buffer.clear()
 		
 		while True:
-			# Use a blocking get() to ensure there's at least one chunk of data.
-			data = [buff.get()]
-			
-			# Now consume whatever other data's still buffered.
-			while True:
-				try:
-					data.append(buff.get(block=False))
-				except queue.Empty:
-					break
-			
-			# `None` in the buffer signals that we should stop generating. Put the
-			# data back into the buffer for the next generator.
-			if None in data:
-				data.remove(None)
-				if data:
-					buff.put(b''.join(data))
+			# Wait until there's at least one chunk of data, then consume whatever
+			# else is buffered, up to a batch. A stop signal means we should stop generating; the
+			# unread data stays in the buffer for the next generator.
+			data = await buff.read(cls.MAX_BATCH_BYTES, cls.BATCH_SECS, cls.MAX_BATCH_BYTES)
+			if data is None:
 				break
-			else:
-				overlap_buffer.extend(data)
 			
-			yield b''.join(data)
+			overlap_buffer.extend(data)
+			
+			yield data
 
 
-	def _fill_buffer(self, buff, in_data, frame_count, time_info, status_flags):
-		"""Continuously collect from the audio stream, into the buffer."""
-		buff.put(in_data)
-		return None, pyaudio.paContinue
-	
-	
-	# [START audio_stream]
-	@contextlib.contextmanager
-	def record_audio(self, rate, chunk):
-		"""Opens a recording stream in a context manager."""
-		# Create a thread-safe buffer of audio data
-		buff = queue.Queue()
-		
-		audio_stream = self.audio_interface.open(
-			format=self.FORMAT,
+	@classmethod
+	def _capture_audio(cls, buff, rate, chunk, recording, closing):
+		"""Records into `buff` until `closing` is set. Runs in its own process."""
+		# Ctrl-C is handled by the main process, which shuts this one down.
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+		
+		gate = SilenceGate(chunk * cls.CHANNELS, cls.SILENCE_RMS,
+			cls.SILENCE_HANGOVER_CHUNKS, cls.SILENCE_KEEPALIVE_CHUNKS)
+		
+		# PortAudio calls this for every chunk, so everything it needs is bound
+		# up front rather than looked up on each call.
+		def fill_buffer(in_data, frame_count, time_info, status_flags,
+				_is_open=gate.is_open, _write=buff.write, _result=(None, pyaudio.paContinue)):
+			"""Continuously collect from the audio stream, into the buffer."""
+			if _is_open(in_data):
+				_write(in_data)
+			return _result
+		
+		audio_interface = pyaudio.PyAudio()
+		audio_stream = audio_interface.open(
+			format=cls.FORMAT,
 			# The API currently only supports 1-channel (mono) audio
 			# https://goo.gl/z757pE
 			channels=1, rate=rate,
 			input=True, frames_per_buffer=chunk,
 			# Run the audio stream asynchronously to fill the buffer object.
 			# This is necessary so that the input device's buffer doesn't overflow
-			# while the calling thread makes network requests, etc.
-			stream_callback=functools.partial(self._fill_buffer, buff),
+			# while the consumer makes network requests, etc.
+			stream_callback=fill_buffer,
 		)
+		recording.set()
 		
-		yield buff
+		closing.wait()
 		
 		audio_stream.stop_stream()
 		audio_stream.close()
+		audio_interface.terminate()
+	
+	
+	# [START audio_stream]
+	@contextlib.asynccontextmanager
+	async def record_audio(self, rate, chunk):
+		"""Records audio in a separate process, in an async context manager."""
+		loop = asyncio.get_running_loop()
+		
+		# Create a buffer of audio data shared with the capture process
+		buff = AudioBuffer(chunk * self.CHANNELS * self.SAMPLE_WIDTH,
+			self.MAX_STALL_SECS * rate // chunk)
+		recording = mp_context.Event()
+		closing = mp_context.Event()
 		
-		# Signal the _audio_data_generator to finish
-		buff.put(None)
-		self.audio_interface.terminate()  # [END audio_stream]
+		capture = mp_context.Process(
+			target=self._capture_audio, args=(buff, rate, chunk, recording, closing))
+		capture.daemon = True
+		capture.start()
+		
+		# Waiting on the capture process blocks, so it's done off the event loop.
+		try:
+			while not await loop.run_in_executor(None, recording.wait, 0.1):
+				if not capture.is_alive():
+					raise RuntimeError('Audio capture process exited before recording started')
+			
+			yield buff
+		
+		finally:
+			closing.set()
+			await loop.run_in_executor(None, capture.join)
+			
+			# Signal the _audio_data_generator to finish
+			buff.stop()
+			buff.close()  # [END audio_stream]
 
 
-	@staticmethod
-	def request_stream(data_stream, rate, interim_results=True):
-		"""Yields `StreamingRecognizeRequest`s constructed from a recording audio
-		stream.
-		Args:
-				data_stream: A generator that yields raw audio data to send.
-				rate: The sampling rate in hertz.
-				interim_results: Whether to return intermediate results, before the
-						transcription is finalized.
+	@classmethod
+	def config_request(cls, rate, interim_results=True):
+		"""Returns the initial `StreamingRecognizeRequest` for a stream, which
+		carries metadata about the stream so the server knows how to interpret it.
+		The request is built once per configuration and reused for every stream.
 		"""
-		# The initial request must contain metadata about the stream, so the
-		# server knows how to interpret it.
+		key = (rate, interim_results)
+		if key in cls._config_requests:
+			return cls._config_requests[key]
+		
 		recognition_config = cloud_speech_pb2.RecognitionConfig(
 			# There are a bunch of config options you can specify. See
 			# https://goo.gl/KPZn97 for the full list.
@@ -185,24 +555,41 @@ class Client:
 			single_utterance=True,
 		)
 		
-		yield cloud_speech_pb2.StreamingRecognizeRequest(
+		request = cloud_speech_pb2.StreamingRecognizeRequest(
 			streaming_config=streaming_config)
+		cls._config_requests[key] = request
+		return request
+	
+	
+	@classmethod
+	async def request_stream(cls, data_stream, rate, interim_results=True):
+		"""Yields `StreamingRecognizeRequest`s constructed from a recording audio
+		stream.
+		Args:
+				data_stream: An async generator that yields raw audio data to send.
+				rate: The sampling rate in hertz.
+				interim_results: Whether to return intermediate results, before the
+						transcription is finalized.
+		"""
+		# The initial request must contain metadata about the stream, so the
+		# server knows how to interpret it.
+		yield cls.config_request(rate, interim_results)
 		
-		for data in data_stream:
+		async for data in data_stream:
 			# Subsequent requests can all just have the content
 			yield cloud_speech_pb2.StreamingRecognizeRequest(audio_content=data)
 	
 	
-	def listen_print_loop(self, recognize_stream, buff):
+	async def listen_print_loop(self, recognize_stream, buff):
 		"""Iterates through server responses and prints them.
-		The recognize_stream passed is a generator that will block until a response
-		is provided by the server. When the transcription response comes, print it.
-		In this case, responses are provided for interim results as well. If the
+		The recognize_stream passed is an async iterator that will wait until a
+		response is provided by the server. When the transcription response comes,
+		print it. In this case, responses are provided for interim results as well. If the
 		response is an interim one, print a line feed at the end of it, to allow
 		the next result to overwrite it, until the response is a final one. For the
 		final one, print a newline to preserve the finalized transcription.
 		"""
-		for resp in recognize_stream:
+		async for resp in recognize_stream:
 			if resp.error.code != code_pb2.OK:
 				raise RuntimeError('Server error: ' + resp.error.message)
 			
@@ -210,23 +597,37 @@ class Client:
 				if resp.endpointer_type is resp.END_OF_UTTERANCE:
 					# Signal the audio generator to stop generating, and leave the
 					# buffer to fill.
-					buff.put(None)
+					buff.stop()
 				continue
 			
 			result = resp.results[0]
 			transcript = result.alternatives[0].transcript
 			
+			# Interim results often repeat the previous transcript unchanged, in
+			# which case there's nothing new to act on. Final results are always
+			# handled, since they drive the prompt/command state.
+			if not result.is_final and transcript == self._last_transcript:
+				continue
+			self._last_transcript = '' if result.is_final else transcript
+			
 			if self.listening_for_prompt and self.getting_bots_attention(transcript):
 				self.listening_for_prompt = False
+				self._play_attention()
 			
 			if self.listening_for_command and result.is_final:
 				self.listening_for_command = False
 				self.listening_for_prompt = True
-				print 'Heard command: ' + transcript
+				print('Heard command: ' + transcript)
 			
 			if not self.listening_for_prompt and not self.listening_for_command and result.is_final:
 				self.listening_for_command = True
 
 
 	def getting_bots_attention(self, text):
-		return self.BOT_NAME.lower() in text.lower().split()
\ No newline at end of file
+		# Most transcripts don't mention the bot at all, so rule out the ones
+		# that can't contain its name before running the regex.
+		lower, upper = self.ATTENTION_INITIALS
+		if lower not in text and upper not in text:
+			return False
+		
+		return bool(self.ATTENTION_RE.search(text))
@@ -1,4 +1,10 @@
+import asyncio
+
 from client import Client
 
-client = Client()
-client.listen()
\ No newline at end of file
+if __name__ == '__main__':
+	client = Client()
+	try:
+		asyncio.run(client.listen())
+	finally:
+		client.close()